@@ -16,12 +16,16 @@ If this program helps you in your research, please cite.
 import argparse
 import csv
 import gzip
+import importlib
+import importlib.util
+import io
+import os
 import sys
 import re
 from pathlib import Path
 
 import yaml
-from typing import Optional, List, Dict, Callable, Any, Set
+from typing import Optional, List, Dict, Callable, Any, Set, Tuple, NamedTuple, Union
 
 # --- Primitive operations ---------------------------------------------------
 
@@ -88,27 +92,30 @@ def bucketize_age(v: Optional[str], groups: List[Dict[str, Any]]) -> Optional[st
             return g['name']
     return 'Unknown'
 
-def normalize_multivalue(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]:
-    """
-    Split a multi-value string on configured delimiters, trim tokens,
-    map each via optional 'map_values', drop empties, optional dedupe,
-    then join with 'join_with' (default ';').
-    """
+def _prepare_multivalue(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve normalize_multivalue defaults and precompile the delimiter regex."""
+    if not isinstance(cfg, dict):
+        raise ValueError("normalize_multivalue needs a mapping of options")
+    delims = cfg.get('delimiters', [',', ';', '|', '/'])
+    return {
+        'split': re.compile('|'.join(re.escape(d) for d in delims)).split,
+        'join_with': cfg.get('join_with', ';'),
+        'mapping': cfg.get('map_values', {}) or cfg.get('mapping', {}),
+        'drop_empty': cfg.get('drop_empty', True),
+        'dedupe': cfg.get('dedupe', False),
+    }
+
+def _normalize_multivalue_prepared(v: Optional[str], p: Dict[str, Any]) -> Optional[str]:
     if v is None or not v.strip():
         return None
 
-    delims = cfg.get('delimiters', [',', ';', '|', '/'])
-    join_with = cfg.get('join_with', ';')
-    mapping = cfg.get('map_values', {}) or cfg.get('mapping', {})
-    drop_empty = cfg.get('drop_empty', True)
-    dedupe = cfg.get('dedupe', False)
-
-    pat = '|'.join(re.escape(d) for d in delims)
-    tokens = re.split(pat, v)
+    mapping = p['mapping']
+    drop_empty = p['drop_empty']
+    dedupe = p['dedupe']
 
     out: List[str] = []
     seen: Set[str] = set()
-    for t in tokens:
+    for t in p['split'](v):
         t = t.strip().strip("'\"")
         if drop_empty and not t:
             continue
@@ -119,7 +126,15 @@ def normalize_multivalue(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]
             seen.add(mapped)
         out.append(mapped)
 
-    return join_with.join(out)
+    return p['join_with'].join(out)
+
+def normalize_multivalue(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]:
+    """
+    Split a multi-value string on configured delimiters, trim tokens,
+    map each via optional 'map_values', drop empties, optional dedupe,
+    then join with 'join_with' (default ';').
+    """
+    return _normalize_multivalue_prepared(v, _prepare_multivalue(cfg))
 
 def days_to_iso8601_bin(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]:
     """
@@ -181,54 +196,264 @@ def days_to_iso8601_bin(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]:
 
     return cfg.get('on_error')
 
-# Registry of zero-arg primitives
-PRIMITIVES: Dict[str, Callable[[Optional[str]], Optional[str]]] = {
-    'strip_quotes': strip_quotes,
-    'trim': trim,
-    'collapse_spaces': collapse_spaces,
-    'remove_all_spaces': remove_all_spaces,
-    'normalize_sex': normalize_sex,
-}
+def _prepare_regex(cfg: Dict[str, Any]) -> Tuple[Any, str, int]:
+    """Compile a regex_replace config: {pattern, repl='', ignore_case=false, count=0}."""
+    if not isinstance(cfg, dict) or not isinstance(cfg.get('pattern'), str):
+        raise ValueError("regex_replace needs a 'pattern' string")
+    flags = re.IGNORECASE if cfg.get('ignore_case') else 0
+    return re.compile(cfg['pattern'], flags), cfg.get('repl', ''), int(cfg.get('count', 0))
+
+def _regex_replace_prepared(v: Optional[str], p: Tuple[Any, str, int]) -> Optional[str]:
+    if v is None:
+        return None
+    pat, repl, count = p
+    return pat.sub(repl, v, count=count)
+
+def regex_replace(v: Optional[str], cfg: Dict[str, Any]) -> Optional[str]:
+    """Regex substitution (Python 're' syntax); the pattern is compiled at config load."""
+    return _regex_replace_prepared(v, _prepare_regex(cfg))
+
+# --- Operation registry -----------------------------------------------------
+
+class OpSpec(NamedTuple):
+    """
+    A registered operation.
+      fn(v) or fn(v, arg)          -> per-cell implementation
+      takes_arg                    -> used as '{name: arg}' in YAML, else as 'name'
+      pure                         -> output depends only on input; results are memoized.
+                                      Off by default: ops must opt in to caching
+      prepare(arg) -> arg          -> run once at config load (e.g. compile regexes)
+      batch(values[, arg]) -> list -> optional whole-column variant used on chunks
+    """
+    name: str
+    fn: Callable[..., Optional[str]]
+    takes_arg: bool = False
+    pure: bool = False
+    prepare: Optional[Callable[[Any], Any]] = None
+    batch: Optional[Callable[..., List[Optional[str]]]] = None
+
+OPS: Dict[str, OpSpec] = {}
+
+def register_op(name: str, fn: Callable[..., Optional[str]], *, takes_arg: bool = False,
+                pure: bool = False, prepare: Optional[Callable[[Any], Any]] = None,
+                batch: Optional[Callable[..., List[Optional[str]]]] = None,
+                replace: bool = False) -> OpSpec:
+    """Register an operation usable from mapping YAML; see OpSpec for the contract."""
+    if not replace and name in OPS:
+        raise ValueError(f"Op '{name}' is already registered")
+    spec = OpSpec(name, fn, takes_arg, pure, prepare, batch)
+    OPS[name] = spec
+    return spec
+
+def _arg_of_type(name: str, kind: type, what: str) -> Callable[[Any], Any]:
+    """prepare() hook that only checks the YAML argument type."""
+    def prepare(arg: Any) -> Any:
+        if not isinstance(arg, kind):
+            raise ValueError(f"Op '{name}' needs {what}, got {arg!r}")
+        return arg
+    return prepare
+
+for _fn in (strip_quotes, trim, collapse_spaces, remove_all_spaces, normalize_sex):
+    register_op(_fn.__name__, _fn, pure=True)
+register_op('map_values', map_values, takes_arg=True, pure=True,
+            prepare=_arg_of_type('map_values', dict, 'a mapping'),
+            batch=lambda vals, m: [m.get(v, v) for v in vals])
+register_op('remove_suffix', remove_suffix, takes_arg=True, pure=True,
+            prepare=_arg_of_type('remove_suffix', str, 'a string'))
+register_op('bucketize_age', bucketize_age, takes_arg=True, pure=True,
+            prepare=_arg_of_type('bucketize_age', list, 'a list of groups'))
+register_op('normalize_multivalue', _normalize_multivalue_prepared, takes_arg=True, pure=True,
+            prepare=_prepare_multivalue)
+register_op('days_to_iso8601_bin', days_to_iso8601_bin, takes_arg=True, pure=True,
+            prepare=_arg_of_type('days_to_iso8601_bin', dict, 'a mapping of options'))
+register_op('regex_replace', _regex_replace_prepared, takes_arg=True, pure=True,
+            prepare=_prepare_regex)
+
+# --- Plugins ----------------------------------------------------------------
+
+PLUGIN_ENTRY_POINT_GROUP = 'clarid_tools.csv2_clarid_in.ops'
+
+# Ops registered by entry-point plugins; --plugins modules may replace them
+_ENTRY_POINT_OPS: Set[str] = set()
+
+class _PluginRegistrar:
+    """
+    The 'register' callable handed to plugin hooks. It has no 'replace'
+    option: names already in OPS can only be overridden if they are in
+    'replaceable'. Added names and replaced specs are recorded so a failing
+    hook can be rolled back.
+    """
+
+    def __init__(self, replaceable: Set[str]):
+        self.replaceable = replaceable
+        self.added: List[str] = []
+        self.replaced: Dict[str, OpSpec] = {}
+
+    def __call__(self, name: str, fn: Callable[..., Optional[str]], *, takes_arg: bool = False,
+                 pure: bool = False, prepare: Optional[Callable[[Any], Any]] = None,
+                 batch: Optional[Callable[..., List[Optional[str]]]] = None) -> OpSpec:
+        if name in OPS and (name not in self.replaceable
+                            or name in self.added or name in self.replaced):
+            raise ValueError(f"Op '{name}' is already registered")
+        if name in OPS:
+            self.replaced[name] = OPS[name]
+        else:
+            self.added.append(name)
+        return register_op(name, fn, takes_arg=takes_arg, pure=pure, prepare=prepare,
+                           batch=batch, replace=True)
+
+    def rollback(self) -> None:
+        for name in self.added:
+            OPS.pop(name, None)
+        OPS.update(self.replaced)
+
+def load_plugin(ref: str) -> None:
+    """
+    Import a plugin (dotted module name or path to a .py file) and call its
+    'register_ops(register)' hook. The hook may replace ops registered by
+    entry-point plugins, but not built-in ops or ops from other --plugins.
+    """
+    if ref.endswith('.py') or os.sep in ref:
+        path = Path(ref)
+        spec = importlib.util.spec_from_file_location(f'_clarid_plugin_{path.stem}', path)
+        if spec is None or spec.loader is None:
+            raise ValueError(f"Cannot load plugin '{ref}'")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(ref)
+    hook = getattr(module, 'register_ops', None)
+    if not callable(hook):
+        raise ValueError(f"Plugin '{ref}' has no register_ops(register) function")
+
+    registrar = _PluginRegistrar(_ENTRY_POINT_OPS)
+    try:
+        hook(registrar)
+    except Exception:
+        registrar.rollback()
+        raise
+    _ENTRY_POINT_OPS.difference_update(registrar.replaced)
+
+def load_entry_point_plugins() -> None:
+    """
+    Call every 'register_ops' hook installed under PLUGIN_ENTRY_POINT_GROUP.
+    A hook that fails (import error, name clash, ...) is reported on STDERR
+    and skipped, and any ops it registered before failing are removed.
+    """
+    from importlib.metadata import entry_points
+    eps = entry_points()
+    group = eps.select(group=PLUGIN_ENTRY_POINT_GROUP) if hasattr(eps, 'select') \
+        else eps.get(PLUGIN_ENTRY_POINT_GROUP, [])
+    for ep in group:
+        # Entry points cannot replace any existing op
+        registrar = _PluginRegistrar(set())
+        try:
+            ep.load()(registrar)
+        except Exception as e:
+            registrar.rollback()
+            print(f"WARNING: Skipping plugin entry point '{ep.name}': {e}", file=sys.stderr)
+            continue
+        _ENTRY_POINT_OPS.update(registrar.added)
 
 # --- Dispatcher -------------------------------------------------------------
 
-def apply_ops(value: Optional[str], ops: Optional[List[object]]) -> Optional[str]:
+class Pipeline:
     """
-    Apply each operation in the exact sequence provided:
-      - string -> zero-arg primitive
-      - dict with 'map_values' -> map_values
-      - dict with other keys -> special ops inline
+    A field's operations resolved against OPS once, at config load.
+    If every op is pure, results are memoized per distinct input value.
     """
-    v = value
-    if not ops:
-        return v
 
-    for op in ops:
-        if isinstance(op, str):
-            fn = PRIMITIVES.get(op)
-            if not fn:
-                raise ValueError(f"Unknown op '{op}'")
-            v = fn(v)
-
-        elif isinstance(op, dict):
-            name, arg = next(iter(op.items()))
-            if name == 'map_values':
-                v = map_values(v, arg)            # run mapping right here
-            elif name == 'remove_suffix':
-                v = remove_suffix(v, arg)         # inline remove_suffix
-            elif name == 'bucketize_age':
-                v = bucketize_age(v, arg)         # inline bucketize_age
-            elif name == 'normalize_multivalue':
-                v = normalize_multivalue(v, arg)  # inline multivalue normalize
-            elif name == 'days_to_iso8601_bin':
-                v = days_to_iso8601_bin(v, arg)
+    MEMO_MAX = 100_000
+
+    def __init__(self, ops: Optional[List[object]]):
+        self.steps: List[Tuple[OpSpec, Any]] = []
+        for op in ops or []:
+            if isinstance(op, str):
+                name, arg = op, None
+            elif isinstance(op, dict) and len(op) == 1:
+                name, arg = next(iter(op.items()))
             else:
+                raise ValueError(f"Invalid op entry: {op}")
+            spec = OPS.get(name)
+            if spec is None:
                 raise ValueError(f"Unknown op '{name}'")
+            if spec.takes_arg and not isinstance(op, dict):
+                raise ValueError(f"Op '{name}' takes an argument; use '{{{name}: ...}}'")
+            if not spec.takes_arg and isinstance(op, dict):
+                raise ValueError(f"Op '{name}' takes no argument; use '{name}'")
+            if spec.takes_arg and spec.prepare:
+                try:
+                    arg = spec.prepare(arg)
+                except (TypeError, AttributeError, KeyError, re.error) as e:
+                    # Malformed argument hitting a prepare() hook (e.g. a plugin's)
+                    raise ValueError(f"Invalid argument for op '{name}': {e}") from e
+            self.steps.append((spec, arg))
+        self.pure = all(spec.pure for spec, _ in self.steps)
+        self._memo: Dict[Optional[str], Optional[str]] = {}
+
+    def _run(self, v: Optional[str]) -> Optional[str]:
+        for spec, arg in self.steps:
+            v = spec.fn(v, arg) if spec.takes_arg else spec.fn(v)
+        return v
 
-        else:
-            raise ValueError(f"Invalid op entry: {op}")
+    def _run_batch(self, values: List[Optional[str]]) -> List[Optional[str]]:
+        for spec, arg in self.steps:
+            if spec.batch:
+                values = spec.batch(values, arg) if spec.takes_arg else spec.batch(values)
+            elif spec.takes_arg:
+                fn = spec.fn
+                values = [fn(v, arg) for v in values]
+            else:
+                values = list(map(spec.fn, values))
+        return values
+
+    def __call__(self, v: Optional[str]) -> Optional[str]:
+        if not self.pure:
+            return self._run(v)
+        try:
+            return self._memo[v]
+        except KeyError:
+            pass
+        out = self._run(v)
+        if len(self._memo) >= self.MEMO_MAX:
+            self._memo.clear()
+        self._memo[v] = out
+        return out
+
+    def apply_batch(self, values: List[Optional[str]]) -> List[Optional[str]]:
+        """Apply the pipeline to a whole column chunk."""
+        if not self.steps:
+            return list(values)
+        if not self.pure:
+            return self._run_batch(values)
+        memo = self._memo
+        todo = [v for v in dict.fromkeys(values) if v not in memo]
+        if todo:
+            if len(memo) + len(todo) > self.MEMO_MAX:
+                memo.clear()
+                todo = list(dict.fromkeys(values))
+            memo.update(zip(todo, self._run_batch(todo)))
+        return [memo[v] for v in values]
+
+def compile_ops(ops: Optional[List[object]]) -> Pipeline:
+    """
+    Resolve a YAML 'operations' list once, for reuse over many cells.
+    Unknown ops, wrong YAML forms and bad arguments raise ValueError here,
+    before any data is read.
+    """
+    return Pipeline(ops)
 
-    return v
+def apply_ops(value: Optional[str], ops: Union[List[object], Pipeline, None]) -> Optional[str]:
+    """
+    Apply each operation in the exact sequence provided:
+      - string -> zero-arg op
+      - dict {name: arg} -> op taking an argument
+    'ops' may also be a Pipeline already built with compile_ops().
+    """
+    if not ops:
+        return value
+    pipeline = ops if isinstance(ops, Pipeline) else compile_ops(ops)
+    return pipeline(value)
 
 # --- I/O Helpers ------------------------------------------------------------
 
@@ -238,6 +463,140 @@ def open_input(path: str):
 def open_output(path: str):
     return gzip.open(path, 'wt', newline='') if path.endswith('.gz') else open(path, 'w', newline='')
 
+def split_output_path(path: str) -> Tuple[str, str]:
+    """Split 'out.csv.gz' into ('out', '.csv.gz') so a shard number can go in between."""
+    gz = '.gz' if path.endswith('.gz') else ''
+    stem, ext = os.path.splitext(path[:-len(gz)] if gz else path)
+    return stem, ext + gz
+
+# --- Sharded output ---------------------------------------------------------
+
+class ShardWriter:
+    """
+    Write rows into numbered shards '<stem>.00001<ext>', '<stem>.00002<ext>', ...
+    Every shard starts with the header row. Rows are buffered per subject_id and
+    a new shard is only started between subject groups, so a group is never
+    split (a single group larger than the limits gets a shard of its own).
+    Limits: max_rows counts data rows; max_bytes counts uncompressed CSV bytes
+    (header included). On close, '<stem>.manifest.csv' lists every shard.
+    """
+
+    MANIFEST_HEADERS = ['shard', 'file', 'rows', 'first_subject_id', 'last_subject_id']
+
+    def __init__(self, path: str, headers: List[str],
+                 max_rows: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.stem, self.ext = split_output_path(path)
+        self.headers = headers
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.shards: List[Dict[str, Any]] = []
+        self._buf = io.StringIO()
+        self._fmt = csv.writer(self._buf, lineterminator='\n')
+        self._fh = None
+        self._group: List[str] = []
+        self._group_id: Optional[int] = None
+        self._header_line = self._render(headers)
+
+    @property
+    def manifest_path(self) -> str:
+        return f'{self.stem}.manifest.csv'
+
+    def _render(self, row: List[str]) -> str:
+        self._buf.seek(0)
+        self._buf.truncate()
+        self._fmt.writerow(row)
+        return self._buf.getvalue()
+
+    def _open_shard(self) -> Dict[str, Any]:
+        path = f'{self.stem}.{len(self.shards) + 1:05d}{self.ext}'
+        self._fh = open_output(path)
+        self._fh.write(self._header_line)
+        shard = {'shard': len(self.shards) + 1, 'file': path, 'rows': 0,
+                 'bytes': len(self._header_line.encode('utf-8')),
+                 'first_subject_id': None, 'last_subject_id': None}
+        self.shards.append(shard)
+        return shard
+
+    def _close_shard(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _flush_group(self) -> None:
+        if not self._group:
+            return
+        nrows = len(self._group)
+        # Only encode to count bytes when a byte limit is set
+        nbytes = sum(len(line.encode('utf-8')) for line in self._group) if self.max_bytes else 0
+
+        shard = self.shards[-1] if self._fh is not None else None
+        if shard is not None and shard['rows'] > 0 and (
+                (self.max_rows and shard['rows'] + nrows > self.max_rows) or
+                (self.max_bytes and shard['bytes'] + nbytes > self.max_bytes)):
+            self._close_shard()
+            shard = None
+        if shard is None:
+            shard = self._open_shard()
+
+        self._fh.write(''.join(self._group))
+        shard['rows'] += nrows
+        shard['bytes'] += nbytes
+        if shard['first_subject_id'] is None:
+            shard['first_subject_id'] = self._group_id
+        shard['last_subject_id'] = self._group_id
+        self._group = []
+
+    def write(self, row: List[str], subject_id: Optional[int] = None) -> None:
+        """Queue a row; rows without a subject_id are treated as single-row groups."""
+        if subject_id is None or subject_id != self._group_id:
+            self._flush_group()
+            self._group_id = subject_id
+        self._group.append(self._render(row))
+
+    def close(self) -> None:
+        self._flush_group()
+        if not self.shards:
+            self._open_shard()  # header-only shard, so downstream jobs still find one
+        self._close_shard()
+        with open(self.manifest_path, 'w', newline='') as fh:
+            writer = csv.writer(fh, lineterminator='\n')
+            writer.writerow(self.MANIFEST_HEADERS)
+            for sh in self.shards:
+                writer.writerow([sh['shard'], os.path.basename(sh['file']), sh['rows'],
+                                 '' if sh['first_subject_id'] is None else sh['first_subject_id'],
+                                 '' if sh['last_subject_id'] is None else sh['last_subject_id']])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_shard()  # no manifest for a partial run
+        return False
+
+class _SingleWriter:
+    """Unsharded output with the same write()/close() interface as ShardWriter."""
+
+    def __init__(self, path: str, headers: List[str]):
+        self._fh = open_output(path)
+        self._writer = csv.writer(self._fh, lineterminator='\n')
+        self._writer.writerow(headers)
+
+    def write(self, row: List[str], subject_id: Optional[int] = None) -> None:
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
 # --- Row blankness helpers --------------------------------------------------
 
 def _is_blank_str(v: Optional[str]) -> bool:
@@ -257,8 +616,28 @@ def _is_empty_row(row: Dict[Any, Any]) -> bool:
         extras_blank = all(_is_blank_str(x) for x in extras)
     return named_blank and extras_blank
 
+def _iter_chunks(reader, subj_src: Optional[str], size: int):
+    """Yield lists of up to 'size' non-skipped input rows."""
+    chunk: List[Dict[Any, Any]] = []
+    for row in reader:
+        # Skip completely empty or overflow-only rows
+        if _is_empty_row(row):
+            continue
+        # In group-mode, skip any row where the raw subject key is missing/blank
+        if subj_src and _is_blank_str(row.get(subj_src)):
+            continue
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 # --- Main -------------------------------------------------------------------
 
+# Rows per column-wise processing chunk
+CHUNK_ROWS = 10_000
+
 def main():
     parser = argparse.ArgumentParser(description='Unified parser for biosample or subject')
     parser.add_argument('--entity', choices=['biosample', 'subject'], required=True,
@@ -268,7 +647,27 @@ def main():
     parser.add_argument('-m', '--mapping', required=True, help='YAML mapping file')
     parser.add_argument('-d', '--delimiter', default='\t',
                         help="Input delimiter (default: tab). Use ',' for CSV.")
+    parser.add_argument('--shard-rows', type=int, default=None, metavar='N',
+                        help='Split output into shards of at most N data rows')
+    parser.add_argument('--shard-bytes', type=int, default=None, metavar='N',
+                        help='Split output into shards of at most N uncompressed bytes')
+    parser.add_argument('--plugins', action='append', default=[], metavar='MODULE',
+                        help='Module name or .py path defining register_ops(register); repeatable')
+    parser.add_argument('--no-entry-points', action='store_true',
+                        help=f'Do not load installed {PLUGIN_ENTRY_POINT_GROUP} plugins')
     args = parser.parse_args()
+    for opt in ('shard_rows', 'shard_bytes'):
+        if getattr(args, opt) is not None and getattr(args, opt) <= 0:
+            parser.error(f"--{opt.replace('_', '-')} must be a positive integer")
+    sharded = args.shard_rows is not None or args.shard_bytes is not None
+
+    if not args.no_entry_points:
+        load_entry_point_plugins()
+    try:
+        for ref in args.plugins:
+            load_plugin(ref)
+    except Exception as e:
+        sys.exit(f"ERROR: Loading plugins: {e}")
 
     cfg: Dict[str, Any] = yaml.safe_load(Path(args.mapping).read_text())
     fields_cfg    = cfg['fields']
@@ -278,7 +677,14 @@ def main():
     # If subject_id has a source, we will be in "group" mode
     subj_cfg = fields_cfg.get('subject_id', {})
     subj_src = subj_cfg.get('source')
-    subj_ops = subj_cfg.get('operations', [])
+
+    # Resolve every pipeline up front: unknown ops and bad regexes fail before any I/O
+    try:
+        subj_pipe = compile_ops(subj_cfg.get('operations', []))
+        pipes = {col: compile_ops(fields_cfg.get(col, {}).get('operations'))
+                 for col in out_headers if col != 'subject_id'}
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
 
     with open_input(args.input) as infile:
         reader = csv.DictReader(infile, delimiter=args.delimiter)
@@ -289,49 +695,49 @@ def main():
         if missing:
             sys.exit(f"ERROR: Missing columns: {missing}")
 
-        with open_output(args.output) as outfile:
-            writer = csv.writer(outfile, lineterminator='\n')
-            writer.writerow(out_headers)
+        if sharded:
+            sink = ShardWriter(args.output, out_headers,
+                               max_rows=args.shard_rows, max_bytes=args.shard_bytes)
+        else:
+            sink = _SingleWriter(args.output, out_headers)
 
+        with sink:
+            has_subject = 'subject_id' in out_headers
             counter = 0
             subject_counter = 0
             last_raw_subject = None
 
-            for row in reader:
-                # Skip completely empty or overflow-only rows
-                if _is_empty_row(row):
-                    continue
-
-                # In group-mode, skip any row where the raw subject key is missing/blank
-                if subj_src and _is_blank_str(row.get(subj_src)):
-                    continue
-
-                counter += 1
-                out: List[str] = []
-                for col in out_headers:
-                    fc = fields_cfg.get(col, {})
-
-                    if col == 'subject_id':
+            for chunk in _iter_chunks(reader, subj_src, CHUNK_ROWS):
+                n = len(chunk)
+                # Column-wise: each field's pipeline runs once over the whole chunk
+                cols: Dict[str, List[Optional[str]]] = {}
+                for col, pipe in pipes.items():
+                    src = fields_cfg.get(col, {}).get('source')
+                    vals = pipe.apply_batch([r.get(src) for r in chunk] if src else [None] * n)
+                    if col in static_fields:
+                        static = static_fields[col]
+                        vals = [static if (v is None or v == '') else v for v in vals]
+                    cols[col] = vals
+                subj_vals = subj_pipe.apply_batch([r.get(subj_src) for r in chunk]) \
+                    if subj_src else None
+
+                for i in range(n):
+                    counter += 1
+                    if has_subject:
                         if subj_src:
-                            raw = row.get(subj_src)
-                            raw = apply_ops(raw, subj_ops)  # type: ignore
-                            if raw != last_raw_subject:
+                            if subj_vals[i] != last_raw_subject:
                                 subject_counter += 1
-                                last_raw_subject = raw
-                            val = str(subject_counter)
+                                last_raw_subject = subj_vals[i]
                         else:
                             subject_counter += 1
-                            val = str(subject_counter)
-                    else:
-                        val = row.get(fc.get('source')) if fc.get('source') else None
-                        val = apply_ops(val, fc.get('operations'))  # type: ignore
-                        if (val is None or val == '') and col in static_fields:
-                            val = static_fields[col]
-
-                    out.append(val or '')
-                writer.writerow(out)
-
-    print(f"Wrote {args.output} ({counter} records)")
+                    out = [str(subject_counter) if col == 'subject_id' else (cols[col][i] or '')
+                           for col in out_headers]
+                    sink.write(out, subject_counter if has_subject else None)
+
+    if sharded:
+        print(f"Wrote {len(sink.shards)} shards + {sink.manifest_path} ({counter} records)")
+    else:
+        print(f"Wrote {args.output} ({counter} records)")
 
 if __name__ == '__main__':
     main()
@@ -1,13 +1,18 @@
 import unittest
 import tempfile
+import gzip
 import os
+import shutil
 import sys
 import csv
 from csv2_clarid_in import (
     strip_quotes, trim, collapse_spaces, remove_all_spaces,
     remove_suffix, map_values, normalize_sex, bucketize_age,
-    apply_ops, main, normalize_multivalue
+    apply_ops, main, normalize_multivalue, split_output_path,
+    regex_replace, register_op, compile_ops, OPS,
+    load_entry_point_plugins, load_plugin
 )
+from unittest import mock
 
 class TestPrimitives(unittest.TestCase):
     def test_strip_quotes(self):
@@ -381,5 +386,254 @@ static_fields:
         self.assertEqual(out_lines[8], "P0D")  # "--" -> None -> static
         self.assertEqual(out_lines[9], "P0D")  # blank -> None -> static
 
+class TestOpRegistry(unittest.TestCase):
+    def register(self, name, fn, **kw):
+        register_op(name, fn, **kw)
+        self.addCleanup(OPS.pop, name, None)
+
+    def test_regex_replace(self):
+        self.assertEqual(regex_replace("TCGA-01-ab", {"pattern": "-", "repl": "_"}), "TCGA_01_ab")
+        ops = [{"regex_replace": {"pattern": "^tcga", "repl": "X", "ignore_case": True}}]
+        self.assertEqual(apply_ops("TCGA-01", ops), "X-01")
+        self.assertIsNone(apply_ops(None, ops))
+        with self.assertRaises(ValueError):
+            compile_ops([{"regex_replace": {"repl": "x"}}])
+
+    def test_unknown_and_duplicate(self):
+        with self.assertRaises(ValueError):
+            compile_ops(["no_such_op"])
+        with self.assertRaises(ValueError):
+            register_op("trim", str.strip)
+
+    def test_wrong_yaml_form(self):
+        # zero-arg op given an argument, arg op given as a bare string
+        with self.assertRaisesRegex(ValueError, "'trim' takes no argument"):
+            compile_ops([{"trim": "x"}])
+        for op in ("map_values", "normalize_multivalue", "regex_replace"):
+            with self.assertRaisesRegex(ValueError, f"'{op}' takes an argument"):
+                compile_ops([op])
+        with self.assertRaisesRegex(ValueError, "Invalid op entry"):
+            compile_ops([{"trim": None, "map_values": {}}])
+
+    def test_bad_arguments(self):
+        for op in ({"normalize_multivalue": None}, {"map_values": None},
+                   {"bucketize_age": {"min": 0}}, {"remove_suffix": 3},
+                   {"days_to_iso8601_bin": "floor"}, {"regex_replace": {"pattern": "("}}):
+            with self.assertRaises(ValueError, msg=op):
+                compile_ops([op])
+        # A plugin prepare() hook failing on a malformed arg is reported as ValueError
+        self.register("test_prep", lambda v, a: v, takes_arg=True, prepare=lambda a: a["k"])
+        with self.assertRaisesRegex(ValueError, "Invalid argument for op 'test_prep'"):
+            compile_ops([{"test_prep": {}}])
+
+    def test_entry_points_failures_are_skipped(self):
+        good = mock.Mock()
+        good.name = "good"
+        good.load.return_value = lambda register: register("ep_op", str.upper)
+        bad = mock.Mock()
+        bad.name = "bad"
+        def clash(register):
+            register("ep_partial", str.lower)
+            register("trim", str.strip)   # clashes with a built-in
+        bad.load.return_value = clash
+        eps = mock.Mock()
+        eps.select.return_value = [good, bad]
+        self.addCleanup(OPS.pop, "ep_op", None)
+        with mock.patch("importlib.metadata.entry_points", return_value=eps), \
+             mock.patch("sys.stderr"):
+            load_entry_point_plugins()
+        self.assertIn("ep_op", OPS)
+        self.assertNotIn("ep_partial", OPS)
+        self.assertIs(OPS["trim"].fn, trim)
+
+        # A --plugins module may replace an entry-point op, not a built-in
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        plugin = os.path.join(tmpdir, "override.py")
+        # A failing module is rolled back: the replaced entry-point op comes back
+        with open(plugin, "w") as f:
+            f.write("def register_ops(register):\n"
+                    "    register('ep_op', lambda v: 'broken')\n"
+                    "    raise RuntimeError('boom')\n")
+        with self.assertRaisesRegex(RuntimeError, "boom"):
+            load_plugin(plugin)
+        self.assertEqual(apply_ops("x", ["ep_op"]), "X")
+        with open(plugin, "w") as f:
+            f.write("def register_ops(register):\n"
+                    "    register('ep_op', lambda v: 'plugin')\n")
+        load_plugin(plugin)
+        self.assertEqual(apply_ops("x", ["ep_op"]), "plugin")
+        with open(plugin, "w") as f:
+            f.write("def register_ops(register):\n"
+                    "    register('trim', lambda v: v)\n")
+        with self.assertRaisesRegex(ValueError, "already registered"):
+            load_plugin(plugin)
+
+    def test_plugins_cannot_replace_builtins(self):
+        hijack = "def register_ops(register):\n" \
+                 "    register('test_new', str.upper)\n" \
+                 "    register('trim', lambda v: 'HIJACKED', replace=True)\n"
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(OPS.pop, "test_new", None)
+        plugin = os.path.join(tmpdir, "hijack.py")
+        with open(plugin, "w") as f:
+            f.write(hijack)
+        with self.assertRaises(TypeError):
+            load_plugin(plugin)
+        ep = mock.Mock()
+        ep.name = "hijack"
+        namespace = {}
+        exec(hijack, namespace)
+        ep.load.return_value = namespace["register_ops"]
+        eps = mock.Mock()
+        eps.select.return_value = [ep]
+        with mock.patch("importlib.metadata.entry_points", return_value=eps), \
+             mock.patch("sys.stderr"):
+            load_entry_point_plugins()
+        self.assertIs(OPS["trim"].fn, trim)
+        self.assertNotIn("test_new", OPS)
+        self.assertEqual(apply_ops(" x ", ["trim"]), "x")
+
+    def test_pure_op_is_memoized(self):
+        calls = []
+        def upper(v):
+            calls.append(v)
+            return v.upper()
+        self.register("test_upper", upper, pure=True)
+        pipe = compile_ops(["test_upper"])
+        self.assertTrue(pipe.pure)
+        self.assertEqual(pipe.apply_batch(["a", "b", "a", "a"]), ["A", "B", "A", "A"])
+        self.assertEqual(pipe("a"), "A")
+        self.assertEqual(calls, ["a", "b"])
+
+    def test_impure_op_not_memoized(self):
+        counter = iter(range(100))
+        self.register("test_seq", lambda v: f"{v}{next(counter)}", pure=False)
+        pipe = compile_ops(["test_seq"])
+        self.assertFalse(pipe.pure)
+        self.assertEqual(pipe.apply_batch(["a", "a"]), ["a0", "a1"])
+
+    def test_batch_variant_and_prepare(self):
+        seen = []
+        def batch(values, arg):
+            seen.append(list(values))
+            return [v + arg for v in values]
+        self.register("test_suffix", lambda v, arg: v + arg, takes_arg=True, pure=True,
+                      prepare=lambda arg: arg * 2, batch=batch)
+        pipe = compile_ops([{"test_suffix": "x"}])
+        self.assertEqual(pipe.apply_batch(["a", "b", "a"]), ["axx", "bxx", "axx"])
+        # Batch runs once, on distinct values only
+        self.assertEqual(seen, [["a", "b"]])
+        self.assertEqual(apply_ops("c", [{"test_suffix": "y"}]), "cyy")
+
+    def test_plugin_module_e2e(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(OPS.pop, "plugin_reverse", None)
+        plugin = os.path.join(tmpdir, "my_ops.py")
+        with open(plugin, "w") as f:
+            f.write(
+                "def register_ops(register):\n"
+                "    register('plugin_reverse', lambda v: v[::-1] if v else v)\n"
+            )
+        tsv = os.path.join(tmpdir, "in.tsv")
+        yml = os.path.join(tmpdir, "map.yaml")
+        out = os.path.join(tmpdir, "out.csv")
+        with open(tsv, "w") as f:
+            f.write("val\nabc\nxyz\n")
+        with open(yml, "w") as f:
+            f.write("output_headers: [val]\n"
+                    "fields:\n  val:\n    source: val\n    operations: [plugin_reverse]\n")
+        old_argv = sys.argv
+        sys.argv = [old_argv[0], '--entity', 'subject', '-i', tsv, '-o', out,
+                    '-m', yml, '--plugins', plugin]
+        try:
+            main()
+        finally:
+            sys.argv = old_argv
+        with open(out) as f:
+            self.assertEqual(f.read().splitlines(), ["val", "cba", "zyx"])
+
+
+class TestShardedOutput(unittest.TestCase):
+    MAPPING = """
+output_headers:
+  - subject_id
+  - val
+fields:
+  subject_id:
+    source: raw_id
+    operations: []
+  val:
+    source: val
+    operations: []
+"""
+
+    def run_parser(self, input_data, extra_args, out_name='out.csv.gz'):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tsv = os.path.join(tmpdir, 'in.tsv')
+        yml = os.path.join(tmpdir, 'map.yaml')
+        with open(tsv, 'w') as f:
+            f.write(input_data)
+        with open(yml, 'w') as f:
+            f.write(self.MAPPING)
+        old_argv = sys.argv
+        sys.argv = [old_argv[0], '--entity', 'subject', '-i', tsv,
+                    '-o', os.path.join(tmpdir, out_name), '-m', yml] + extra_args
+        try:
+            main()
+        finally:
+            sys.argv = old_argv
+        return tmpdir
+
+    def read_shard(self, path):
+        with gzip.open(path, 'rt') as f:
+            return f.read().splitlines()
+
+    def test_split_output_path(self):
+        self.assertEqual(split_output_path('dir/out.csv.gz'), ('dir/out', '.csv.gz'))
+        self.assertEqual(split_output_path('out.csv'), ('out', '.csv'))
+        self.assertEqual(split_output_path('out'), ('out', ''))
+
+    def test_shard_rows_keeps_subject_groups(self):
+        input_data = "raw_id\tval\nA\t1\nA\t2\nB\t3\nC\t4\nC\t5\nC\t6\nD\t7\n"
+        tmpdir = self.run_parser(input_data, ['--shard-rows', '3'])
+
+        s1 = self.read_shard(os.path.join(tmpdir, 'out.00001.csv.gz'))
+        s2 = self.read_shard(os.path.join(tmpdir, 'out.00002.csv.gz'))
+        s3 = self.read_shard(os.path.join(tmpdir, 'out.00003.csv.gz'))
+        self.assertFalse(os.path.exists(os.path.join(tmpdir, 'out.00004.csv.gz')))
+        # Header repeated; groups A+B, C, D
+        self.assertEqual(s1, ['subject_id,val', '1,1', '1,2', '2,3'])
+        self.assertEqual(s2, ['subject_id,val', '3,4', '3,5', '3,6'])
+        self.assertEqual(s3, ['subject_id,val', '4,7'])
+
+        with open(os.path.join(tmpdir, 'out.manifest.csv')) as f:
+            manifest = list(csv.DictReader(f))
+        self.assertEqual([m['file'] for m in manifest],
+                         ['out.00001.csv.gz', 'out.00002.csv.gz', 'out.00003.csv.gz'])
+        self.assertEqual([m['rows'] for m in manifest], ['3', '3', '1'])
+        self.assertEqual([(m['first_subject_id'], m['last_subject_id']) for m in manifest],
+                         [('1', '2'), ('3', '3'), ('4', '4')])
+
+    def test_oversized_group_gets_own_shard(self):
+        input_data = "raw_id\tval\nA\t1\nB\t2\nB\t3\nB\t4\n"
+        tmpdir = self.run_parser(input_data, ['--shard-rows', '2'], out_name='out.csv')
+        with open(os.path.join(tmpdir, 'out.00001.csv')) as f:
+            self.assertEqual(f.read().splitlines(), ['subject_id,val', '1,1'])
+        with open(os.path.join(tmpdir, 'out.00002.csv')) as f:
+            self.assertEqual(f.read().splitlines(), ['subject_id,val', '2,2', '2,3', '2,4'])
+
+    def test_shard_bytes(self):
+        # header 'subject_id,val\n' = 15 bytes, each row '<n>,<n>\n' = 4 bytes
+        input_data = "raw_id\tval\nA\t1\nB\t2\nC\t3\n"
+        tmpdir = self.run_parser(input_data, ['--shard-bytes', '23'], out_name='out.csv')
+        with open(os.path.join(tmpdir, 'out.manifest.csv')) as f:
+            manifest = list(csv.DictReader(f))
+        self.assertEqual([m['rows'] for m in manifest], ['2', '1'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,714 @@
+#!/usr/bin/env python3
+"""
+clarid_decode.py
+
+Bulk decoder for ClarID identifiers (human 'clar_id' and 'stub_id' formats),
+driven by share/clarid-codebook.yaml. Mirrors
+'clarid-tools code --action decode' without the per-process Perl startup:
+reverse-lookup tables are built once per codebook, IDs are decoded in
+streaming batches, optionally across several processes.
+
+$VERSION taken from ClarID::Tools
+
+Copyright (C) 2025 Manuel Rueda - CNAG
+
+License: Artistic License 2.0
+
+If this program helps you in your research, please cite.
+"""
+import argparse
+import csv
+import gzip
+import json
+import re
+import sys
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+
+import yaml
+from typing import Optional, List, Dict, Any, Deque, Iterable, Iterator, Tuple
+
+# --- Defaults ---------------------------------------------------------------
+
+SHARE_DIR = Path(__file__).resolve().parents[2] / 'share'
+DEFAULT_CODEBOOK = SHARE_DIR / 'clarid-codebook.yaml'
+DEFAULT_ICD10_ORDER = SHARE_DIR / 'icd10_order.json'
+DEFAULT_ICD10_MAP = SHARE_DIR / 'icd10.json'
+
+# Keep in sync with @SUPPORTED_CODEBOOK_VERSIONS in lib/ClarID/Tools.pm
+SUPPORTED_CODEBOOK_VERSIONS = ('0.02', '0.03', '0.04')
+
+ON_ERROR_CHOICES = ('raise', 'none')
+
+ENTITY_SYNONYMS = {'biospecimen': 'biosample', 'individual': 'subject'}
+
+# Output column order, as in ClarID::Tools::Command::code
+DECODE_FIELDS: Dict[str, List[str]] = {
+    'biosample': ['project', 'species', 'subject_id', 'tissue', 'sample_type', 'assay',
+                  'condition', 'timepoint', 'duration', 'batch', 'replicate'],
+    'subject': ['study', 'subject_id', 'type', 'condition', 'sex', 'age_group'],
+}
+
+ID_COLUMN = {'human': 'clar_id', 'stub': 'stub_id'}
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE62_REV = {c: i for i, c in enumerate(BASE62)}
+
+# Duration width is structural (see _parse_field in code.pm)
+_DURATION_RE = re.compile(r'^P?(?:[0-9][DWMY]|0N)$')
+_STUB_DURATION_RE = re.compile(r'(\d+)([DWMYN])$')
+_FMT_DIRECTIVE_RE = re.compile(r'%(0?\d*)([ds%])')
+_TAIL_INT_RE = re.compile(r'%0?(\d+)d')
+_LEGACY_TAIL_RE = re.compile(r'(\d{2})$')
+_HUMAN_REPLICATE_RE = re.compile(r'^R(\d{2})$')
+_HUMAN_BATCH_RE = re.compile(r'^B(\d{2})$')
+_BASE62_RE = re.compile(r'^[0-9A-Za-z]+$')
+_LEADING_INT_RE = re.compile(r'\s*[+-]?\d+')
+_CONDITION_SEP_RE = re.compile(r'[+;]')
+_NON_WORD_RE = re.compile(r'\W')
+
+# --- Codebook helpers -------------------------------------------------------
+
+def assert_supported_codebook_version(doc: Dict[str, Any], path: Any) -> None:
+    """Reject codebooks this release does not support (as ClarID::Tools::Util does)."""
+    version = (doc.get('metadata') or {}).get('version')
+    if version is None or str(version) == '':
+        raise ValueError(f"Missing metadata.version in codebook '{path}'")
+    if str(version) not in SUPPORTED_CODEBOOK_VERSIONS:
+        raise ValueError(
+            f"Unsupported codebook version '{version}' in '{path}'. "
+            f"This ClarID-Tools release supports: {', '.join(SUPPORTED_CODEBOOK_VERSIONS)}")
+
+def load_codebook(path: Any = DEFAULT_CODEBOOK) -> Dict[str, Any]:
+    """
+    Load a codebook, check its metadata.version and inject the global
+    '_defaults' entries into each category.
+    """
+    doc = yaml.safe_load(Path(path).read_text())
+    if not isinstance(doc, dict):
+        raise ValueError(f"Expected a HASH in '{path}'")
+    assert_supported_codebook_version(doc, path)
+    ents = doc.get('entities')
+    if not ents:
+        return doc
+    defaults = ents.pop('_defaults', None) or {}
+    for entity in ('biosample', 'subject'):
+        cat = ents.get(entity) or {}
+        for slot, fmap in cat.items():
+            if not isinstance(fmap, dict) or slot.endswith('_pattern'):
+                continue
+            for k, v in defaults.items():
+                fmap.setdefault(k, dict(v))
+    return doc
+
+def base62_to_int(stub: str) -> int:
+    """Parse a base-62 string ([0-9A-Za-z]) into an integer."""
+    if not stub or not _BASE62_RE.match(stub):
+        raise ValueError(f"Bad stub '{stub}'")
+    n = 0
+    for ch in stub:
+        n = n * 62 + BASE62_REV[ch]
+    return n
+
+def _perl_int(s: str) -> int:
+    """int() with Perl semantics for strings: leading digits, else 0."""
+    m = _LEADING_INT_RE.match(s)
+    return int(m.group(0)) if m else 0
+
+def _split_dash(s: str) -> List[str]:
+    """split /-/ as in Perl: trailing empty fields are dropped."""
+    parts = s.split('-')
+    while parts and parts[-1] == '':
+        parts.pop()
+    return parts
+
+def _check_on_error(on_error: str) -> None:
+    if on_error not in ON_ERROR_CHOICES:
+        raise ValueError(f"Invalid on_error '{on_error}' (expected one of: {', '.join(ON_ERROR_CHOICES)})")
+
+def _split_conditions(s: str) -> List[str]:
+    """split /[+;]/ as in Perl: trailing empty fields are dropped."""
+    parts = _CONDITION_SEP_RE.split(s)
+    while parts and parts[-1] == '':
+        parts.pop()
+    return parts
+
+def format_icd10(code: str) -> str:
+    """Insert a dot after the third character of a dot-less ICD-10 code."""
+    if '.' in code or len(code) <= 3:
+        return code
+    return f'{code[:3]}.{code[3:]}'
+
+def _sprintf(fmt: str, args: List[str]) -> str:
+    """Minimal Perl-style sprintf for codebook formats (%s, %d, %0Nd, %%)."""
+    it = iter(args)
+
+    def sub(m: 're.Match') -> str:
+        width, conv = m.groups()
+        if conv == '%':
+            return '%'
+        arg = next(it, '')
+        if conv == 'd':
+            return f'%{width}d' % int(arg or 0)
+        return f'%{width}s' % arg
+
+    return _FMT_DIRECTIVE_RE.sub(sub, fmt)
+
+class _Pattern:
+    """A compiled '<field>_pattern' block (regex + code_format/stub_format)."""
+
+    def __init__(self, pcfg: Dict[str, Any]):
+        self.re = re.compile(f"^(?:{pcfg['regex']})$")
+        self.fmt = {'human': pcfg.get('code_format', '%s'),
+                    'stub': pcfg.get('stub_format', '%s')}
+        self.need = {mode: len(re.findall('%', f.replace('%%', '')))
+                     for mode, f in self.fmt.items()}
+
+    def format(self, val: str, mode: str, field: str) -> str:
+        if field == 'duration' and not _DURATION_RE.match(val):
+            raise ValueError(f"Invalid duration '{val}'")
+        m = self.re.match(val)
+        if not m:
+            raise ValueError(f"Invalid {field} '{val}'")
+        need = self.need[mode]
+        if not need:
+            return self.fmt[mode]
+        caps = [c for c in m.groups() if c is not None][:need]
+        return _sprintf(self.fmt[mode], caps or [val])
+
+class _AffixTable:
+    """Reverse map code -> key, matching the longest code at one end of a string."""
+
+    def __init__(self, by_code: Dict[str, str]):
+        self.by_code = by_code
+        self.lengths = sorted({len(c) for c in by_code if c}, reverse=True)
+
+    def prefix(self, s: str) -> Tuple[Optional[str], str]:
+        for n in self.lengths:
+            key = self.by_code.get(s[:n])
+            if key is not None:
+                return key, s[n:]
+        return None, s
+
+    def suffix(self, s: str) -> Tuple[Optional[str], str]:
+        for n in self.lengths:
+            if n <= len(s):
+                key = self.by_code.get(s[-n:])
+                if key is not None:
+                    return key, s[:-n]
+        return None, s
+
+def _reverse(fmap: Dict[str, Any], attr: str) -> Dict[str, str]:
+    """First key wins, in codebook order."""
+    out: Dict[str, str] = {}
+    for key, entry in (fmap or {}).items():
+        if isinstance(entry, dict) and entry.get(attr) is not None:
+            out.setdefault(str(entry[attr]), key)
+    return out
+
+def _tail_regex(fmt: str) -> 're.Pattern':
+    """Turn a stub_format like 'R%02d' into an end-anchored regex with one capture."""
+    parts = _TAIL_INT_RE.split(fmt)
+    # split() alternates literal, width, literal, ...
+    rx = ''.join(re.escape(p) if i % 2 == 0 else rf'(\d{{{int(p)}}})'
+                 for i, p in enumerate(parts))
+    return re.compile(rx + '$')
+
+# --- Decoder ----------------------------------------------------------------
+
+class ClarIDDecoder:
+    """
+    Decode ClarID identifiers for one entity/format.
+
+    All codebook reverse lookups, pattern regexes and the ICD-10 ordinal table
+    are built in the constructor; decode() only does dictionary lookups and
+    string slicing. Invalid IDs raise ValueError with the same messages, and
+    after the same checks in the same order, as the Perl decoder.
+    """
+
+    def __init__(self, entity: str, fmt: str,
+                 codebook: Any = DEFAULT_CODEBOOK,
+                 icd10_order: Any = DEFAULT_ICD10_ORDER,
+                 icd10_map: Any = DEFAULT_ICD10_MAP,
+                 with_condition_name: bool = False,
+                 subject_id_base62_width: int = 3,
+                 subject_id_pad_length: int = 5):
+        entity = ENTITY_SYNONYMS.get(entity, entity)
+        if entity not in DECODE_FIELDS:
+            raise ValueError(f"Unknown entity '{entity}'")
+        if fmt not in ID_COLUMN:
+            raise ValueError(f"Unknown format '{fmt}'")
+        if subject_id_base62_width <= 0:
+            raise ValueError(f"Invalid stub width '{subject_id_base62_width}'")
+        if subject_id_pad_length <= 0:
+            raise ValueError(f"Invalid pad length '{subject_id_pad_length}'")
+
+        # Kept so worker processes can rebuild an identical decoder
+        self.config = dict(entity=entity, fmt=fmt, codebook=str(codebook),
+                           icd10_order=str(icd10_order), icd10_map=str(icd10_map),
+                           with_condition_name=with_condition_name,
+                           subject_id_base62_width=subject_id_base62_width,
+                           subject_id_pad_length=subject_id_pad_length)
+        self.entity = entity
+        self.format = fmt
+        self.id_column = ID_COLUMN[fmt]
+        self.fields = list(DECODE_FIELDS[entity])
+        if with_condition_name:
+            self.fields.append('condition_name')
+        self.width = subject_id_base62_width
+        self.pad = subject_id_pad_length
+
+        doc = load_codebook(codebook)
+        root = doc.get('entities', doc)
+        cb = root.get(entity)
+        if not cb:
+            raise ValueError(f"No codebook for '{entity}'")
+        self.cb = cb
+        self._sid_re = re.compile(rf'^\d{{{self.pad}}}$')
+
+        attr = 'code' if fmt == 'human' else 'stub_code'
+        self._rev: Dict[str, Dict[str, str]] = {}
+        self._affix: Dict[str, _AffixTable] = {}
+        for slot, fmap in cb.items():
+            if isinstance(fmap, dict) and not slot.endswith('_pattern'):
+                self._rev[slot] = _reverse(fmap, attr)
+                self._affix[slot] = _AffixTable(self._rev[slot])
+        self._patterns = {slot[:-len('_pattern')]: _Pattern(p) for slot, p in cb.items()
+                          if slot.endswith('_pattern') and isinstance(p, dict) and p.get('regex')}
+
+        if entity == 'biosample' and fmt == 'stub':
+            self._species_w = self._species_stub_width(cb.get('species'))
+            self._repl_tail = _tail_regex((cb.get('replicate_pattern') or {}).get('stub_format', '%02d'))
+            self._batch_tail = _tail_regex((cb.get('batch_pattern') or {}).get('stub_format', '%02d'))
+
+        # ordinal -> dot-less ICD-10 code (only stub IDs carry ordinals)
+        self._icd10_by_order: Dict[int, str] = {}
+        if fmt == 'stub':
+            order = json.loads(Path(icd10_order).read_text())
+            self._icd10_by_order = {v: k for k, v in order.items()}
+
+        self._code2name: Optional[Dict[str, str]] = None
+        if with_condition_name:
+            self._code2name = json.loads(Path(icd10_map).read_text())
+
+        # Durations and condition stubs take few distinct values; cache successes
+        self._dur_cache: Dict[Tuple[str, str], str] = {}
+        self._cond_cache: Dict[str, str] = {}
+
+        self._decode = getattr(self, f'_decode_{fmt}_{entity}')
+
+    # -- public API --
+
+    def decode(self, clar_id: str) -> Dict[str, Any]:
+        """Decode one ID into a {field: value} dict (keys in self.fields order)."""
+        res = self._decode(clar_id)
+        if self._code2name is not None:
+            res['condition_name'] = ';'.join(
+                self._code2name.get(_NON_WORD_RE.sub('', c), '')
+                for c in _split_conditions(res['condition']))
+        return res
+
+    def decode_batch(self, ids: List[Optional[str]], on_error: str = 'raise') -> List[Optional[Dict[str, Any]]]:
+        """
+        Decode a list of IDs; with on_error='none', undecodable IDs yield None.
+        A None entry (row without an ID column) always raises.
+        """
+        _check_on_error(on_error)
+        out: List[Optional[Dict[str, Any]]] = []
+        for i in ids:
+            if i is None:
+                raise ValueError(f'Missing {self.id_column} in input row')
+            if on_error == 'raise':
+                out.append(self.decode(i))
+                continue
+            try:
+                out.append(self.decode(i))
+            except ValueError:
+                out.append(None)
+        return out
+
+    def decode_many(self, ids: Iterable[Optional[str]], batch_size: int = 10_000,
+                    processes: int = 1, on_error: str = 'raise') -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Lazily decode an iterable of IDs, in input order. With processes > 1
+        batches are spread over a multiprocessing pool; each worker builds its
+        own decoder once. A bad on_error raises here, not on first iteration.
+        """
+        _check_on_error(on_error)
+        return self._iter_decoded(ids, batch_size, processes, on_error)
+
+    def _iter_decoded(self, ids: Iterable[Optional[str]], batch_size: int,
+                      processes: int, on_error: str) -> Iterator[Optional[Dict[str, Any]]]:
+        batches = _batched(ids, batch_size)
+        if processes <= 1:
+            for batch in batches:
+                yield from self.decode_batch(batch, on_error)
+            return
+        # Keep a steady number of batches in flight: a new batch is submitted
+        # as soon as the oldest result is consumed, so workers never wait for
+        # a window to drain and input is still read lazily
+        in_flight = processes * 2
+        pending: Deque[Any] = deque()
+        with Pool(processes, initializer=_init_worker, initargs=(self.config, on_error)) as pool:
+            for batch in batches:
+                pending.append(pool.apply_async(_worker_decode, (batch,)))
+                if len(pending) >= in_flight:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+
+    # -- per-format decoders (see ClarID::Tools::Command::code) --
+
+    def _lookup(self, slot: str, code: str, what: str) -> str:
+        key = self._rev.get(slot, {}).get(code)
+        if key is None:
+            raise ValueError(f"Unknown {slot} {what} '{code}'")
+        return key
+
+    def _condition_from_ordinal(self, stub3: str) -> str:
+        try:
+            return self._cond_cache[stub3]
+        except KeyError:
+            pass
+        ordinal = base62_to_int(stub3)
+        code = self._icd10_by_order.get(ordinal)
+        if ordinal < 1 or code is None:
+            raise ValueError(f"Invalid condition ordinal '{ordinal}'")
+        self._cond_cache[stub3] = out = format_icd10(code)
+        return out
+
+    def _duration(self, val: str, mode: str) -> str:
+        key = (val, mode)
+        try:
+            return self._dur_cache[key]
+        except KeyError:
+            pass
+        pat = self._patterns.get('duration')
+        if pat is None:
+            raise ValueError('No pattern for duration')
+        self._dur_cache[key] = out = pat.format(val, mode, 'duration')
+        return out
+
+    def _decode_human_biosample(self, clar_id: str) -> Dict[str, Any]:
+        p = _split_dash(clar_id)
+        if len(p) < 9:
+            raise ValueError('Bad biosample ID')
+        prc, sc, sid, tc, stc, ac, cn, ptc, du = p[:9]
+        rest = p[9:]
+
+        project = self._lookup('project', prc, 'code')
+        species = self._lookup('species', sc, 'code')
+        tissue = self._lookup('tissue', tc, 'code')
+        stype = self._lookup('sample_type', stc, 'code')
+        assay = self._lookup('assay', ac, 'code')
+
+        if not self._sid_re.match(sid):
+            raise ValueError(f"Bad subject_id in ID '{sid}'")
+
+        batch: Any = ''
+        replicate: Any = ''
+        if rest:
+            m = _HUMAN_REPLICATE_RE.match(rest[-1])
+            if m:
+                replicate = int(m.group(1))
+                rest.pop()
+            if rest:
+                m = _HUMAN_BATCH_RE.match(rest[-1])
+                if m:
+                    batch = int(m.group(1))
+
+        timepoint = self._lookup('timepoint', ptc, 'code')
+        duration = self._duration(du, 'human')
+
+        known = self.cb.get('condition') or {}
+        condition = ';'.join(c if c in known else format_icd10(c) for c in cn.split('+'))
+
+        return {
+            'project': project, 'species': species, 'subject_id': int(sid),
+            'tissue': tissue, 'sample_type': stype, 'assay': assay,
+            'condition': condition, 'timepoint': timepoint, 'duration': duration,
+            'batch': batch, 'replicate': replicate,
+        }
+
+    def _decode_stub_biosample(self, stub_id: str) -> Dict[str, Any]:
+        if not stub_id:
+            raise ValueError('Bad stub ID')
+        s = stub_id
+
+        replicate: Any = None
+        batch: Any = None
+        m = self._repl_tail.search(s)
+        if m:
+            replicate, s = int(m.group(1)), s[:m.start()]
+        m = self._batch_tail.search(s)
+        if m:
+            batch, s = int(m.group(1)), s[:m.start()]
+        # Legacy fallback for old (unprefixed) stubs
+        if replicate is None:
+            m = _LEGACY_TAIL_RE.search(s)
+            if m:
+                replicate, s = int(m.group(1)), s[:m.start()]
+        if batch is None:
+            m = _LEGACY_TAIL_RE.search(s)
+            if m:
+                batch, s = int(m.group(1)), s[:m.start()]
+
+        m = _STUB_DURATION_RE.search(s)
+        if not m:
+            raise ValueError('Bad stub ID (duration)')
+        s = s[:m.start()]
+        duration = f'P{m.group(1)}{m.group(2)}'
+        self._duration(duration, 'stub')
+        duration = self._duration(duration, 'human')
+
+        timepoint, s = self._affix['timepoint'].suffix(s)
+        if timepoint is None:
+            raise ValueError('Unknown timepoint stub at end of ID')
+
+        m = _LEGACY_TAIL_RE.search(s)
+        if not m:
+            raise ValueError('Missing condition count')
+        cond_count, head = int(m.group(1)), s[:m.start()]
+        if cond_count <= 0:
+            raise ValueError(f"Invalid condition count '{cond_count}'")
+
+        project, head = self._affix['project'].prefix(head)
+        if project is None:
+            raise ValueError('Unknown project stub')
+
+        w = self._species_w
+        if len(head) < w:
+            raise ValueError('Stub too short to contain species')
+        species = self._lookup('species', head[:w], 'stub')
+        head = head[w:]
+
+        subject_id = base62_to_int(head[:self.width])
+        head = head[self.width:]
+
+        tissue, head = self._affix['tissue'].prefix(head)
+        if tissue is None:
+            raise ValueError(f"Unknown tissue stub '{head}'")
+        stype, head = self._affix['sample_type'].prefix(head)
+        if stype is None:
+            raise ValueError('Unknown sample_type stub')
+        assay, head = self._affix['assay'].prefix(head)
+        if assay is None:
+            raise ValueError('Unknown assay stub')
+
+        if len(head) % 3:
+            raise ValueError('Bad condition stub length')
+        c_stubs = [head[i:i + 3] for i in range(0, len(head), 3)]
+        if len(c_stubs) != cond_count:
+            raise ValueError(f'Condition count mismatch (have {len(c_stubs)}, expected {cond_count})')
+
+        return {
+            'project': project, 'species': species, 'subject_id': subject_id,
+            'tissue': tissue, 'sample_type': stype, 'assay': assay,
+            'condition': ';'.join(self._condition_from_ordinal(c) for c in c_stubs),
+            'timepoint': timepoint, 'duration': duration,
+            'batch': '' if batch is None else batch,
+            'replicate': '' if replicate is None else replicate,
+        }
+
+    def _decode_human_subject(self, clar_id: str) -> Dict[str, Any]:
+        p = _split_dash(clar_id)
+        if len(p) != 6:
+            raise ValueError('Bad subject ID')
+        study, sid, type_c, co, sex_c, ag_code = p
+        age_group = self._lookup('age_group', ag_code, 'code')
+        return {
+            'study': study, 'subject_id': _perl_int(sid), 'type': type_c,
+            'condition': co, 'sex': sex_c, 'age_group': age_group,
+        }
+
+    def _decode_stub_subject(self, stub_id: str) -> Dict[str, Any]:
+        # Layout: STUDY + SID(w) + TYPE(1) + CONDS(3*n) + COUNT(2) + SEX(1) + AGE(2)
+        s = stub_id or ''
+        if len(s) < 5:
+            raise ValueError('Bad condition count in stub')
+        age_s, sex_s, count_s, s = s[-2:], s[-3], s[-5:-3], s[:-5]
+        cond_count = _perl_int(count_s)
+        if cond_count <= 0:
+            raise ValueError(f"Invalid condition count '{cond_count}'")
+        n = cond_count * 3
+        if len(s) < n:
+            raise ValueError('Bad condition stub length')
+        conds_s, s = s[len(s) - n:], s[:len(s) - n]
+        if not s:
+            raise ValueError('Missing type stub')
+        type_s, s = s[-1], s[:-1]
+        if len(s) < self.width:
+            raise ValueError('Missing subject_id stub')
+        sid_s, study = s[len(s) - self.width:], s[:len(s) - self.width]
+
+        # Same order as code.pm: subject_id, type, sex, age_group, conditions
+        subject_id = base62_to_int(sid_s)
+        type_key = self._lookup('type', type_s, 'stub')
+        sex_key = self._lookup('sex', sex_s, 'stub')
+        age_group = self._lookup('age_group', age_s, 'stub')
+        condition = ';'.join(self._condition_from_ordinal(conds_s[i:i + 3])
+                             for i in range(0, n, 3))
+        return {
+            'study': study, 'subject_id': subject_id, 'type': type_key,
+            'condition': condition, 'sex': sex_key, 'age_group': age_group,
+        }
+
+    @staticmethod
+    def _species_stub_width(species: Optional[Dict[str, Any]]) -> int:
+        if not species:
+            raise ValueError('Missing species codebook section')
+        widths = set()
+        for key, entry in species.items():
+            if key == 'Not Available':
+                continue
+            stub = (entry or {}).get('stub_code')
+            if stub is None or not str(stub):
+                raise ValueError(f"Missing species stub_code for '{key}'")
+            widths.add(len(str(stub)))
+        if len(widths) != 1:
+            raise ValueError('Species stub_code values must all have the same length')
+        return widths.pop()
+
+# --- Batching / multiprocessing ---------------------------------------------
+
+def _batched(it: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(it)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+_WORKER: Optional[ClarIDDecoder] = None
+_WORKER_ON_ERROR = 'raise'
+
+def _init_worker(config: Dict[str, Any], on_error: str) -> None:
+    global _WORKER, _WORKER_ON_ERROR
+    _WORKER = ClarIDDecoder(**config)
+    _WORKER_ON_ERROR = on_error
+
+def _worker_decode(ids: List[Optional[str]]) -> List[Optional[Dict[str, Any]]]:
+    return _WORKER.decode_batch(ids, _WORKER_ON_ERROR)  # type: ignore
+
+# --- I/O Helpers ------------------------------------------------------------
+
+def open_input(path: str):
+    return gzip.open(path, 'rt', newline='') if path.endswith('.gz') else open(path, 'r', newline='')
+
+def open_output(path: str):
+    return gzip.open(path, 'wt', newline='') if path.endswith('.gz') else open(path, 'w', newline='')
+
+def _csv_line(values: List[Any], sep: str) -> str:
+    """Format like Text::CSV_XS defaults: quote on sep, quotes, newlines or spaces."""
+    out = []
+    for v in values:
+        v = '' if v is None else str(v)
+        if v and (sep in v or any(c in v for c in '" \t\r\n')):
+            v = '"' + v.replace('"', '""') + '"'
+        out.append(v)
+    return sep.join(out) + '\n'
+
+def decode_file(decoder: ClarIDDecoder, infile: str, outfile: Optional[str] = None,
+                sep: str = ',', batch_size: int = 10_000, processes: int = 1,
+                on_error: str = 'raise') -> int:
+    """
+    Stream 'infile' (CSV/TSV, gz ok) and append the decoded fields to every
+    row, like 'clarid-tools code --action decode --infile'. The ID column is
+    'clar_id' (human) or 'stub_id' (stub). Returns the number of rows written.
+    """
+    with open_input(infile) as fin:
+        reader = csv.reader(fin, delimiter=sep)
+        try:
+            header = next(reader)
+        except StopIteration:
+            raise ValueError('Failed to read header') from None
+        # Like getline_hr: duplicate column names resolve to the last one, and
+        # a row without the ID column fails with 'Missing <col> in input row'
+        id_idx = len(header) - 1 - header[::-1].index(decoder.id_column) \
+            if decoder.id_column in header else len(header)
+
+        # Rows waiting for their decoded result, in input order
+        pending: Deque[List[str]] = deque()
+
+        def ids() -> Iterator[Optional[str]]:
+            for row in reader:
+                pending.append(row)
+                yield row[id_idx] if id_idx < len(row) else None
+
+        n = 0
+        fout = open_output(outfile) if outfile else sys.stdout
+        try:
+            fout.write(_csv_line(header + decoder.fields, sep))
+            for res in decoder.decode_many(ids(), batch_size, processes, on_error):
+                row = pending.popleft()
+                row = (row + [''] * (len(header) - len(row)))[:len(header)]
+                vals = [res[f] for f in decoder.fields] if res else [''] * len(decoder.fields)
+                fout.write(_csv_line(row + vals, sep))
+                n += 1
+        finally:
+            if outfile:
+                fout.close()
+    return n
+
+# --- Main -------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Decode ClarID identifiers (clar_id / stub_id) in bulk')
+    parser.add_argument('--entity', required=True,
+                        choices=['biosample', 'subject', 'biospecimen', 'individual'],
+                        help='biosample | subject (synonyms: biospecimen, individual)')
+    parser.add_argument('--format', required=True, choices=['human', 'stub'],
+                        help='human | stub')
+    parser.add_argument('--infile', help='Input CSV/TSV with a clar_id or stub_id column (gz ok)')
+    parser.add_argument('--outfile', help='Output file (gz ok; default: STDOUT)')
+    parser.add_argument('--clar_id', '--stub_id', dest='clar_id', help='Single ID to decode')
+    parser.add_argument('--sep', default=',', help="Separator (default: ',')")
+    parser.add_argument('--codebook', default=str(DEFAULT_CODEBOOK), help='Path to codebook.yaml')
+    parser.add_argument('--icd10-map', '--icd10_map', dest='icd10_map',
+                        default=str(DEFAULT_ICD10_MAP), help='Path to ICD-10 map JSON')
+    parser.add_argument('--icd10-order', '--icd10_order', dest='icd10_order',
+                        default=str(DEFAULT_ICD10_ORDER), help='Path to icd10_order.json')
+    parser.add_argument('--with-condition-name', '--with_condition_name',
+                        dest='with_condition_name', action='store_true',
+                        help='Append human-readable condition_name')
+    parser.add_argument('--subject-id-base62-width', '--subject_id_base62_width',
+                        dest='width', type=int, default=3,
+                        help='Base-62 characters used for subject ID stubs (default: 3)')
+    parser.add_argument('--subject-id-pad-length', '--subject_id_pad_length',
+                        dest='pad', type=int, default=5,
+                        help='Decimal padding width for subject IDs in human format (default: 5)')
+    parser.add_argument('--batch-size', type=int, default=10_000,
+                        help='IDs per decoding batch (default: 10000)')
+    parser.add_argument('-j', '--processes', type=int, default=1,
+                        help='Worker processes (default: 1)')
+    parser.add_argument('--on-error', choices=ON_ERROR_CHOICES, default='raise',
+                        help="'none' leaves the decoded columns empty for invalid IDs")
+    args = parser.parse_args(argv)
+
+    if (args.infile is None) == (args.clar_id is None):
+        parser.error('use exactly one of --infile or --clar_id/--stub_id')
+    if args.batch_size <= 0 or args.processes <= 0:
+        parser.error('--batch-size and --processes must be positive integers')
+
+    try:
+        decoder = ClarIDDecoder(args.entity, args.format, codebook=args.codebook,
+                                icd10_order=args.icd10_order, icd10_map=args.icd10_map,
+                                with_condition_name=args.with_condition_name,
+                                subject_id_base62_width=args.width,
+                                subject_id_pad_length=args.pad)
+        if args.infile:
+            decode_file(decoder, args.infile, args.outfile, sep=args.sep,
+                        batch_size=args.batch_size, processes=args.processes,
+                        on_error=args.on_error)
+        else:
+            res = decoder.decode(args.clar_id)
+            for f in decoder.fields:
+                print(f'{f}: {res[f]}')
+    except (ValueError, OSError) as e:
+        sys.exit(f'ERROR: {e}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import unittest
+import tempfile
+import gzip
+import os
+import shutil
+from pathlib import Path
+from clarid_decode import (
+    ClarIDDecoder, base62_to_int, format_icd10, decode_file, main
+)
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Expected values from t/bulk.t and t/code.t
+BIOSAMPLE_STUBS = {
+    'CT01001LNR0N401B0DB01R05': ['CNAG-Test', 'Human', 1, 'Liver', 'Normal', 'RNA_seq',
+                                 'C22.0', 'Baseline', 'P0D', 1, 5],
+    'CT02002NTC0X301T7WB02R02': ['CNAG-Test', 'Mouse', 2, 'Brain', 'Tumor', 'ChIP_seq',
+                                 'C71.0', 'Treatment', 'P7W', 2, 2],
+    'CT04003BNE2x101S1MB03R01': ['CNAG-Test', 'Zebrafish', 3, 'Blood', 'Normal', 'WES',
+                                 'I46', 'Surgery', 'P1M', 3, 1],
+    'CT03004KNS0W301C3YB01R10': ['CNAG-Test', 'Rat', 4, 'Kidney', 'Normal', 'LC_MS',
+                                 'C66', 'Challenge', 'P3Y', 1, 10],
+}
+
+class TestHelpers(unittest.TestCase):
+    def test_base62_to_int(self):
+        self.assertEqual(base62_to_int('000'), 0)
+        self.assertEqual(base62_to_int('0G9'), 1001)
+        self.assertEqual(base62_to_int('264W'), 500000)
+        with self.assertRaisesRegex(ValueError, "Bad stub '0-1'"):
+            base62_to_int('0-1')
+
+    def test_format_icd10(self):
+        self.assertEqual(format_icd10('I25110'), 'I25.110')
+        self.assertEqual(format_icd10('C22.0'), 'C22.0')
+        self.assertEqual(format_icd10('I46'), 'I46')
+
+class TestDecoder(unittest.TestCase):
+    def test_biosample_human(self):
+        d = ClarIDDecoder('biosample', 'human')
+        res = d.decode('TCGA_AML-HomSap-00001-LIV-TUM-RNA-I25.110-BSL-P0D-B01-R05')
+        self.assertEqual([res[f] for f in d.fields],
+                         ['TCGA-AML', 'Human', 1, 'Liver', 'Tumor', 'RNA_seq',
+                          'I25.110', 'Baseline', 'P0D', 1, 5])
+        # batch/replicate are optional
+        res = d.decode('CNAG_Test-HomSap-00001-LIV-NOR-RNA-C22.0+C22.2-BSL-P0D')
+        self.assertEqual(res['condition'], 'C22.0;C22.2')
+        self.assertEqual((res['batch'], res['replicate']), ('', ''))
+
+    def test_biosample_stub(self):
+        d = ClarIDDecoder('biospecimen', 'stub')
+        self.assertEqual(d.entity, 'biosample')
+        res = d.decode('AML01001LTR2to01C1MB01R05')
+        self.assertEqual((res['project'], res['condition'], res['timepoint'], res['duration']),
+                         ('TCGA-AML', 'I25.110', 'Challenge', 'P1M'))
+        for stub, want in BIOSAMPLE_STUBS.items():
+            res = d.decode(stub)
+            self.assertEqual([res[f] for f in d.fields], want, stub)
+
+    def test_subject_human_and_stub(self):
+        d = ClarIDDecoder('subject', 'human')
+        self.assertEqual(d.decode('TestCohort-00007-Case-I25.110-Male-A20_29'),
+                         {'study': 'TestCohort', 'subject_id': 7, 'type': 'Case',
+                          'condition': 'I25.110', 'sex': 'Male', 'age_group': 'Age20to29'})
+        d = ClarIDDecoder('subject', 'stub', subject_id_base62_width=4)
+        self.assertEqual(d.decode('TestCohort264WC2to01MA2'),
+                         {'study': 'TestCohort', 'subject_id': 500000, 'type': 'Case',
+                          'condition': 'I25.110', 'sex': 'Male', 'age_group': 'Age20to29'})
+
+    def test_condition_name(self):
+        d = ClarIDDecoder('biosample', 'human', with_condition_name=True)
+        self.assertEqual(d.fields[-1], 'condition_name')
+        res = d.decode('CNAG_Test-HomSap-00001-LIV-NOR-RNA-C22.0+C24.4-BSL-P0D-B01-R05')
+        self.assertEqual(res['condition_name'], 'Liver cell carcinoma;')
+        # split /[+;]/ drops trailing empty fields, as in Perl
+        d = ClarIDDecoder('subject', 'human', with_condition_name=True)
+        res = d.decode('COPDStudy-01001-Case-J44.9+-Male-A40_49')
+        self.assertEqual(res['condition_name'],
+                         'Chronic obstructive pulmonary disease, unspecified')
+
+    def test_errors(self):
+        d = ClarIDDecoder('biosample', 'human')
+        with self.assertRaisesRegex(ValueError, 'Bad biosample ID'):
+            d.decode('TCGA_AML-HomSap')
+        with self.assertRaisesRegex(ValueError, "Unknown project code 'NOPE'"):
+            d.decode('NOPE-HomSap-00001-LIV-TUM-RNA-I25.110-BSL-P0D')
+        with self.assertRaisesRegex(ValueError, 'Invalid duration'):
+            d.decode('TCGA_AML-HomSap-00001-LIV-TUM-RNA-I25.110-BSL-P12D')
+        self.assertEqual(d.decode_batch(['bad', 'TCGA_AML-HomSap-00001-LIV-TUM-RNA-I25.110-BSL-P0D'],
+                                        on_error='none')[0], None)
+        with self.assertRaisesRegex(ValueError, "Invalid on_error 'rasie'"):
+            d.decode_batch(['bad'], on_error='rasie')
+        with self.assertRaisesRegex(ValueError, "Invalid on_error 'rasie'"):
+            d.decode_many(['bad'], on_error='rasie')
+
+    def test_error_messages_match_perl(self):
+        d = ClarIDDecoder('biosample', 'stub')
+        with self.assertRaisesRegex(ValueError, "^Bad stub '!!1'$"):
+            d.decode('CT01!!1LNR0N401B0DB01R05')
+        d = ClarIDDecoder('subject', 'stub')
+        # unknown sex stub 'Z' and invalid condition ordinal '000': sex is checked first
+        with self.assertRaisesRegex(ValueError, "^Unknown sex stub 'Z'$"):
+            d.decode('COPDStudy0G9C00001ZA4')
+        with self.assertRaisesRegex(ValueError, "^Invalid condition count '0'$"):
+            d.decode('COPDStudy0G9C3Of0xMA4')
+        with self.assertRaisesRegex(ValueError, "^Missing stub_id in input row$"):
+            d.decode_batch([None], on_error='none')
+
+    def test_codebook_version_check(self):
+        with self.assertRaisesRegex(
+                ValueError,
+                r"Unsupported codebook version '0\.05'.*supports: 0\.02, 0\.03, 0\.04"):
+            ClarIDDecoder('biosample', 'stub',
+                          codebook=ROOT / 't' / 'data' / 'unsupported_codebook.yaml')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cb = os.path.join(tmpdir, 'cb.yaml')
+        with open(cb, 'w') as f:
+            f.write('metadata:\n  author: Test\nentities: {}\n')
+        with self.assertRaisesRegex(ValueError, 'Missing metadata.version'):
+            ClarIDDecoder('biosample', 'stub', codebook=cb)
+        for version in ('0.02', '0.03'):
+            ClarIDDecoder('biosample', 'human',
+                          codebook=ROOT / 'share' / 'versions' / version / 'clarid-codebook.yaml')
+
+    def test_decode_many_batches_and_processes(self):
+        d = ClarIDDecoder('biosample', 'stub')
+        ids = list(BIOSAMPLE_STUBS) * 5
+        want = [d.decode(i) for i in ids]
+        self.assertEqual(list(d.decode_many(iter(ids), batch_size=3)), want)
+        self.assertEqual(list(d.decode_many(iter(ids), batch_size=3, processes=2)), want)
+
+    def test_decode_many_pool_reads_lazily(self):
+        d = ClarIDDecoder('biosample', 'stub')
+        consumed = []
+
+        def feed():
+            for i in list(BIOSAMPLE_STUBS) * 50:
+                consumed.append(i)
+                yield i
+
+        gen = d.decode_many(feed(), batch_size=1, processes=2)
+        self.assertEqual(next(gen)['project'], 'CNAG-Test')
+        # at most processes * 2 batches in flight
+        self.assertLessEqual(len(consumed), 4)
+        gen.close()
+        with self.assertRaisesRegex(ValueError, 'Bad stub ID'):
+            list(d.decode_many(['CT01001LNR0N401B0DB01R05', ''], batch_size=1, processes=2))
+
+class TestDecodeFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_bulk_subject_stub_gz(self):
+        infile = os.path.join(self.tmpdir, 'in.csv.gz')
+        outfile = os.path.join(self.tmpdir, 'out.csv.gz')
+        with open(ROOT / 'ex' / 'subject_to_decode_stub.csv', 'rb') as src, \
+             gzip.open(infile, 'wb') as dst:
+            dst.write(src.read())
+        n = decode_file(ClarIDDecoder('subject', 'stub'), infile, outfile, processes=2, batch_size=1)
+        self.assertEqual(n, 4)
+        with gzip.open(outfile, 'rt') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'unique_id,stub_id,study,subject_id,type,condition,sex,age_group')
+        self.assertEqual(lines[2], 'patient_002,AsthmaCohort0GAN3SM01FA5,AsthmaCohort,1002,Control,J98.51,Female,Age50to59')
+
+    def test_cli_with_condition_name_matches_perl(self):
+        outfile = os.path.join(self.tmpdir, 'out.csv')
+        main(['--entity', 'biosample', '--format', 'human', '--with_condition_name',
+              '--infile', str(ROOT / 'ex' / 'biosample_to_decode.csv'), '--outfile', outfile])
+        with open(outfile) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 5)
+        # Text::CSV_XS quotes fields containing spaces
+        self.assertEqual(
+            lines[2],
+            'samp002,CNAG_Test-MusMus-00002-BRN-TUM-CHI-C71.0-TRT-P7W-B02-R02,CNAG-Test,Mouse,2,'
+            'Brain,Tumor,ChIP_seq,C71.0,Treatment,P7W,2,2,'
+            '"Malignant neoplasm of cerebrum, except lobes and ventricles"')
+
+    def test_missing_id_column(self):
+        with self.assertRaisesRegex(ValueError, '^Missing stub_id in input row$'):
+            decode_file(ClarIDDecoder('subject', 'stub'),
+                        str(ROOT / 'ex' / 'subject_to_decode_human.csv'), os.devnull)
+        # short row: earlier rows are decoded, the short one fails like getline_hr
+        infile = os.path.join(self.tmpdir, 'short.csv')
+        with open(infile, 'w') as f:
+            f.write('unique_id,stub_id\npatient_001,COPDStudy0G9C3Of01MA4\npatient_002\n')
+        with self.assertRaisesRegex(ValueError, '^Missing stub_id in input row$'):
+            decode_file(ClarIDDecoder('subject', 'stub'), infile, os.devnull, batch_size=1)
+        with self.assertRaises(SystemExit):
+            main(['--entity', 'subject', '--format', 'stub',
+                  '--infile', str(ROOT / 'ex' / 'subject_to_decode_human.csv')])
+
+if __name__ == '__main__':
+    unittest.main()